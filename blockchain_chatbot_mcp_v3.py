@@ -8,26 +8,79 @@ using the official MCP SDK patterns.
 """
 
 import os
+import re
+import sys
 import asyncio
 import json
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass
+import logging
+import time
+import hashlib
+import heapq
+import operator
+from collections import deque
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Reversible, Tuple
+from dataclasses import asdict, dataclass
 
+import httpx
 from dotenv import load_dotenv
 from groq import AsyncGroq
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+# Optional: faster JSON encoding/decoding, stdlib json is used otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional: enables the ClickHouse HTTP + Arrow fast path for run_select_query
+try:
+    import pyarrow as pa
+    import pyarrow.csv
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+# Optional: persists the response and tool-list caches across restarts
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Optional: compresses responses stored in the DuckDB cache
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
-@dataclass
-class DatabaseSchema:
-    """Database schema information for context"""
-    
-    def get_schema_context(self) -> str:
-        return """
+# Environment passed to the MCP server subprocess; the MCP SDK adds its own
+# safe defaults (HOME, USER, ...) on top of these
+_MCP_ENV_KEYS = ("PATH", "PYTHONPATH", "VIRTUAL_ENV")
+_MCP_ENV_PREFIXES = ("CLICKHOUSE_", "CHDB_")
+
+# Tool lists keyed by MCP server command: key -> (monotonic timestamp, tools)
+_TOOLS_CACHE: Dict[Tuple, Tuple[float, List["ToolSpec"]]] = {}
+
+# On-disk copy of the tool list so cold starts can skip tools/list; only
+# used when DuckDB is not installed
+_TOOLS_CACHE_FILE = Path.home() / ".cache" / "blockchain_chatbot" / "tools.json"
+
+# DuckDB file holding the persistent response and tool-list caches
+_CACHE_DB_FILE = Path.home() / ".cache" / "blockchain_chatbot" / "cache.duckdb"
+
+# Frame header of zstd-compressed blobs in the DuckDB cache
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+# Static schema description embedded in the system prompt
+_SCHEMA_CONTEXT = """
         ETHEREUM BLOCKCHAIN DATABASE SCHEMA (goteth_mainnet)
         
         You are analyzing Ethereum Proof-of-Stake consensus layer data. Key tables:
@@ -75,41 +128,413 @@ class DatabaseSchema:
         """
 
 
+@dataclass(slots=True)
+class DatabaseSchema:
+    """Database schema information for context"""
+    
+    def get_schema_context(self) -> str:
+        return _SCHEMA_CONTEXT
+
+
+# Dynamic tail of the system prompt, sent after the cacheable prefix
+_SYSTEM_PROMPT_TAIL = """
+After receiving tool results, provide a comprehensive answer based on the data.
+"""
+
+
+# Rows of a fast-path query result shown to the LLM
+_RESULT_PREVIEW_ROWS = 100
+
+# Row cap enforced on every run_select_query statement
+_MAX_QUERY_ROWS = 100
+
+# SQL guard patterns for run_select_query (see _guard_select_query)
+_LEADING_COMMENT_RE = re.compile(r"\s*(?:--[^\n]*(?:\n|$)|/\*(?:(?!\*/).)*\*/)", re.DOTALL)
+_TRAILING_COMMENT_RE = re.compile(r"(?:\s*(?:--[^\n]*|/\*(?:(?!\*/).)*\*/))+\s*$", re.DOTALL)
+_READ_RE = re.compile(r"\(*\s*(SELECT|WITH)\b", re.IGNORECASE)
+_METADATA_RE = re.compile(r"(SHOW|DESCRIBE|DESC|EXPLAIN|EXISTS)\b", re.IGNORECASE)
+_QUOTED_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`(?:[^`\\]|\\.)*`", re.DOTALL)
+_SETTING_PATTERN = r"\w+\s*=\s*(?:'[^']*'|[\w.+-]+)"
+_SQL_TAIL_RE = re.compile(
+    rf"(?:\s+SETTINGS\s+{_SETTING_PATTERN}(?:\s*,\s*{_SETTING_PATTERN})*)?(?:\s+FORMAT\s+\w+)?\s*$",
+    re.IGNORECASE
+)
+_TRAILING_FORMAT_RE = re.compile(r"\bFORMAT\s+\w+\s*$", re.IGNORECASE)
+_TRAILING_LIMIT_RE = re.compile(
+    r"\bLIMIT\s+(?:\d+\s*,\s*)?(\d+)(?:\s+OFFSET\s+\d+)?(?:\s+WITH\s+TIES)?\s*$", re.IGNORECASE
+)
+
+
+def _mask_quoted(match: re.Match) -> str:
+    """Blank out a quoted literal or identifier, keeping its quotes and length"""
+    text = match.group(0)
+    return text[0] + "_" * (len(text) - 2) + text[-1]
+
+
+# Prefix shared by the TOOL_CALL: and TOOL_CALLS: response tags
+_TOOL_TAG = "TOOL_CALL"
+
+# Longest tag text ("TOOL_CALLS:") that may straddle two streamed chunks
+_TOOL_TAG_SPAN = len(_TOOL_TAG) + 2
+
+# Inputs that end the interactive chat
+_EXIT_CMDS = frozenset({"quit", "exit", "bye"})
+
+# Approximate token budget for conversation history sent to the LLM
+_HISTORY_TOKEN_BUDGET = 4000
+
+# Hard cap on the number of conversation messages kept in memory
+_MAX_HISTORY_MESSAGES = 40
+
+# Tool results longer than this are cut to their head and tail for the LLM
+_MAX_TOOL_RESULT_CHARS = 4000
+
+# Shared decoder for pulling tool-call JSON out of LLM responses; orjson
+# has no raw_decode, so boundary detection stays on the stdlib decoder
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _dump_json(obj: Any, sort_keys: bool = False) -> bytes:
+    """
+    Serialize obj to compact UTF-8 JSON bytes, using orjson when available
+    
+    Falls back to stdlib json for values orjson rejects, such as integers
+    beyond 64 bits.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+        except TypeError:
+            pass
+    return json.dumps(
+        obj, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def _load_json(data: Any) -> Any:
+    """Parse JSON from str or bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Responses are only cached at or below this sampling temperature
+_MAX_CACHEABLE_TEMPERATURE = 0.1
+
+# Seconds the Groq warmup may delay session startup
+_LLM_WARMUP_TIMEOUT = 5.0
+
+
+def _echo_token(token: str):
+    """Write a streamed LLM token to the terminal immediately"""
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+
+async def _ainput(prompt: str) -> str:
+    """
+    Read a line from stdin without blocking the event loop
+    
+    A terminal is watched with loop.add_reader, so nothing is left blocked
+    in input() when the loop stops (e.g. on Ctrl+C). Other stdin (pipes,
+    or loops without add_reader) is read on a worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    if not sys.stdin.isatty():
+        return await asyncio.to_thread(input, prompt)
+    
+    fd = sys.stdin.fileno()
+    future = loop.create_future()
+    
+    def on_readable():
+        if not future.done():
+            future.set_result(sys.stdin.readline())
+    
+    try:
+        loop.add_reader(fd, on_readable)
+    except NotImplementedError:
+        return await asyncio.to_thread(input, prompt)
+    
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    try:
+        line = await future
+    finally:
+        loop.remove_reader(fd)
+    
+    if not line:
+        raise EOFError
+    return line.rstrip("\n")
+
+
+@dataclass(slots=True, frozen=True)
+class ToolSpec:
+    """An MCP tool as advertised by the server"""
+    name: str
+    description: str
+    input_schema: Dict[str, Any]
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    """A cached LLM response and its lifetime"""
+    response: str
+    created: float
+    ttl: float
+    
+    @property
+    def expires_at(self) -> float:
+        return self.created + self.ttl
+
+
 class MCPToolError(Exception):
     """Exception raised when MCP tool execution fails"""
     pass
 
 
+class CacheStore:
+    """
+    DuckDB-backed persistence for the response and tool-list caches
+    """
+    
+    def __init__(self, path: Path = _CACHE_DB_FILE):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = duckdb.connect(str(path))
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache "
+            "(key TEXT PRIMARY KEY, response BLOB, created DOUBLE, ttl DOUBLE)"
+        )
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS tools_cache "
+            "(key TEXT PRIMARY KEY, tools BLOB, created DOUBLE)"
+        )
+        self._con.execute("DELETE FROM llm_cache WHERE created + ttl < ?", [time.time()])
+        
+        self._compressor = zstandard.ZstdCompressor() if zstandard is not None else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+    
+    @classmethod
+    def open(cls) -> Optional["CacheStore"]:
+        """Open the default cache file, or return None if DuckDB is unavailable"""
+        if duckdb is None:
+            return None
+        
+        try:
+            return cls()
+        except (duckdb.Error, OSError) as e:
+            # Typically another process holding the file lock
+            logger.warning("⚠️  Warning: Could not open cache database: %s", e)
+            return None
+    
+    def _pack(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if self._compressor is not None else data
+    
+    def _unpack(self, blob: bytes) -> Optional[bytes]:
+        if not blob.startswith(_ZSTD_MAGIC):
+            return blob
+        if self._decompressor is None:
+            return None
+        return self._decompressor.decompress(blob)
+    
+    def load_responses(self, limit: int) -> List[Tuple[str, CacheEntry]]:
+        """Return up to limit unexpired responses, longest-lived first"""
+        try:
+            rows = self._con.execute(
+                "SELECT key, response, created, ttl FROM llm_cache "
+                "WHERE created + ttl > ? ORDER BY created + ttl DESC LIMIT ?",
+                [time.time(), limit]
+            ).fetchall()
+        except duckdb.Error as e:
+            logger.warning("⚠️  Warning: Could not load cached responses: %s", e)
+            return []
+        
+        entries = []
+        for key, blob, created, ttl in rows:
+            data = self._unpack(blob)
+            if data is not None:
+                entries.append((key, CacheEntry(response=data.decode(), created=created, ttl=ttl)))
+        return entries
+    
+    def save_response(self, key: str, entry: CacheEntry):
+        try:
+            self._con.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+                [key, self._pack(entry.response.encode()), entry.created, entry.ttl]
+            )
+        except duckdb.Error as e:
+            logger.warning("⚠️  Warning: Could not persist cached response: %s", e)
+    
+    def delete_responses(self, keys: List[str], now: float):
+        """Delete the given responses and every response expired by now"""
+        try:
+            self._con.execute(
+                "DELETE FROM llm_cache WHERE list_contains(?, key) OR created + ttl < ?",
+                [keys, now]
+            )
+        except duckdb.Error as e:
+            logger.warning("⚠️  Warning: Could not delete cached responses: %s", e)
+    
+    def load_tools(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored {"created", "tools"} entry for a server key"""
+        try:
+            row = self._con.execute(
+                "SELECT tools, created FROM tools_cache WHERE key = ?", [key]
+            ).fetchone()
+        except duckdb.Error as e:
+            logger.warning("⚠️  Warning: Could not load cached tools: %s", e)
+            return None
+        
+        if row is None:
+            return None
+        return {"created": row[1], "tools": _load_json(row[0])}
+    
+    def save_tools(self, key: str, tools: List[Dict[str, Any]], created: float):
+        try:
+            self._con.execute(
+                "INSERT OR REPLACE INTO tools_cache VALUES (?, ?, ?)",
+                [key, _dump_json(tools), created]
+            )
+        except duckdb.Error as e:
+            logger.warning("⚠️  Warning: Could not persist tool cache: %s", e)
+    
+    def close(self):
+        """Close the DuckDB connection, releasing the file lock"""
+        try:
+            self._con.close()
+        except duckdb.Error as e:
+            logger.warning("⚠️  Warning: Could not close cache database: %s", e)
+
+
+class ResponseCache:
+    """
+    Exact-match cache for LLM responses with per-entry TTL
+    
+    Entries live in memory; when a CacheStore is given, unexpired entries
+    are loaded from it on startup, and every set writes the new entry
+    through and deletes the evicted and expired ones.
+    """
+    
+    def __init__(self, max_entries: int = 1024, store: Optional[CacheStore] = None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: Dict[str, CacheEntry] = {}
+        # (expires_at, key) pairs; stale pairs are skipped when popped
+        self._expiry_heap: List[Tuple[float, str]] = []
+        
+        if store is not None:
+            for key, entry in store.load_responses(max_entries):
+                self._entries[key] = entry
+                heapq.heappush(self._expiry_heap, (entry.expires_at, key))
+    
+    def _evict_expired(self, now: float) -> List[str]:
+        """Drop expired entries and return their keys"""
+        evicted_keys = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry_heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                del self._entries[key]
+                evicted_keys.append(key)
+        return evicted_keys
+    
+    def get(self, key: str) -> Optional[str]:
+        self._evict_expired(time.time())
+        entry = self._entries.get(key)
+        return entry.response if entry is not None else None
+    
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        evicted_keys = self._evict_expired(now)
+        
+        entry = CacheEntry(response=value, created=now, ttl=ttl)
+        self._entries[key] = entry
+        heapq.heappush(self._expiry_heap, (entry.expires_at, key))
+        
+        # Over capacity: drop the entries closest to expiry
+        while len(self._entries) > self.max_entries:
+            evicted_expires_at, evicted_key = heapq.heappop(self._expiry_heap)
+            evicted = self._entries.get(evicted_key)
+            if evicted is not None and evicted.expires_at == evicted_expires_at:
+                del self._entries[evicted_key]
+                evicted_keys.append(evicted_key)
+        
+        if self.store is not None:
+            # Delete first: key may also name an older, now expired entry
+            self.store.delete_responses(evicted_keys, now)
+            # The new entry itself is evicted when it is the closest to expiry
+            if self._entries.get(key) is entry:
+                self.store.save_response(key, entry)
+
+
 class BlockchainChatbotMCPv3:
     """
     Blockchain analytics chatbot using official MCP SDK patterns
     """
     
-    def __init__(self):
+    def __init__(self, cache: bool = True, cache_ttl_seconds: float = 300,
+                 response_cache_ttl_seconds: float = 600):
         # Initialize Groq LLM
         self.groq_client = AsyncGroq(
             api_key=os.getenv("GROQ_API_KEY"),
         )
         self.model_name = os.getenv("GROQ_MODEL", "llama-3.1-70b-versatile")
+        self.temperature = 0.1  # Low temperature for precise analysis
+        
+        # Claude models take Anthropic-style content blocks with explicit
+        # cache_control; other providers rely on implicit prefix caching
+        self.use_cache_control = "claude" in self.model_name.lower()
         
         # MCP server configuration for ClickHouse
         self.mcp_server_params = StdioServerParameters(
             command="python",
             args=["-m", "mcp_clickhouse.main"],
-            env=dict(os.environ)
+            env={
+                key: value for key, value in os.environ.items()
+                if key in _MCP_ENV_KEYS or key.startswith(_MCP_ENV_PREFIXES)
+            }
         )
         
+        # Direct ClickHouse HTTP access for run_select_query (optional)
+        self.clickhouse_http_url = os.getenv("CLICKHOUSE_HTTP_URL")
+        self._http: Optional[httpx.AsyncClient] = None
+        
+        # Content extractors for MCP tool results, keyed by content item type
+        self._content_extractors: Dict[type, Callable[[Any], Any]] = {}
+        
         # Database schema context
         self.schema = DatabaseSchema()
         
         # Available MCP tools (will be populated after connection)
-        self.available_tools: List[Dict[str, Any]] = []
+        self.available_tools: List[ToolSpec] = []
+        
+        # Tool list caching (in-memory and on disk, see _discover_tools);
+        # cache=False also disables the LLM response cache and DuckDB store
+        self.cache = cache
+        self.cache_ttl_seconds = cache_ttl_seconds
+        
+        # LLM response caching (see get_llm_response)
+        self._cache_store = CacheStore.open() if cache else None
+        self.response_cache = ResponseCache(store=self._cache_store)
+        self.response_cache_ttl_seconds = response_cache_ttl_seconds
+        
+        # Conversation so far (user, assistant and tool-result messages);
+        # the system message is kept separately as a fixed head
+        self._history: Deque[Dict[str, str]] = deque(maxlen=_MAX_HISTORY_MESSAGES)
+        
+        # System prompt, rebuilt only when the tool list changes
+        self._system_prompt: Optional[str] = None
+        self._system_message: Optional[Dict[str, Any]] = None
+        
+        # Persistent MCP session (lazily created by _get_session)
+        self._exit_stack: Optional[AsyncExitStack] = None
+        self._session_ctx = None
+        self._session: Optional[ClientSession] = None
+        self._session_lock = asyncio.Lock()
         
     async def create_mcp_session(self):
         """
         Create MCP session using proper async context manager pattern
         """
-        print("🔌 Connecting to ClickHouse MCP server...")
+        logger.info("🔌 Connecting to ClickHouse MCP server...")
         
         # Use proper async context manager pattern from official SDK
         return stdio_client(self.mcp_server_params)
@@ -117,71 +542,359 @@ class BlockchainChatbotMCPv3:
     async def initialize_session(self, session: ClientSession):
         """
         Initialize MCP session and discover tools
+        
+        The Groq connection is warmed up concurrently, so its TLS handshake
+        overlaps MCP initialization instead of delaying the first turn.
         """
-        await session.initialize()
-        print("✅ MCP connection established and initialized")
+        warmup = asyncio.create_task(self._warmup_llm())
+        
+        try:
+            await session.initialize()
+            logger.info("✅ MCP connection established and initialized")
+            
+            # Discover available tools
+            await self._discover_tools(session)
+        except BaseException:
+            warmup.cancel()
+            raise
         
-        # Discover available tools
-        await self._discover_tools(session)
+        await warmup
     
-    async def _discover_tools(self, session: ClientSession):
-        """Discover and cache available MCP tools"""
+    async def _warmup_llm(self):
+        """
+        Open a pooled connection to Groq ahead of the first completion
+        
+        The copy made by with_options shares the client's connection pool;
+        its short timeout and no retries keep a slow endpoint from holding
+        up startup.
+        """
         try:
-            tools_result = await session.list_tools()
-            self.available_tools = [
-                {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema if hasattr(tool, 'inputSchema') else {}
-                }
-                for tool in tools_result.tools
-            ]
+            await self.groq_client.with_options(
+                timeout=_LLM_WARMUP_TIMEOUT, max_retries=0
+            ).models.list()
+        except Exception as e:
+            logger.debug("LLM warmup failed: %s", e)
+    
+    async def _get_session(self) -> ClientSession:
+        """
+        Return the shared MCP session, spawning and initializing it on first use
+        
+        Later calls reuse the live session, skipping the stdio spawn and the
+        initialize/list_tools handshake.
+        """
+        async with self._session_lock:
+            if self._session is not None:
+                return self._session
+            
+            exit_stack = AsyncExitStack()
+            try:
+                self._session_ctx = await self.create_mcp_session()
+                read_stream, write_stream = await exit_stack.enter_async_context(self._session_ctx)
+                session = await exit_stack.enter_async_context(
+                    ClientSession(read_stream, write_stream)
+                )
+                await self.initialize_session(session)
+            except BaseException:
+                await exit_stack.aclose()
+                self._session_ctx = None
+                raise
             
-            print(f"🔧 Discovered {len(self.available_tools)} MCP tools:")
-            for tool in self.available_tools:
-                print(f"   - {tool['name']}: {tool['description']}")
+            self._exit_stack = exit_stack
+            self._session = session
+            return session
+    
+    async def aclose(self):
+        """
+        Tear down the shared MCP session, its stdio transport, the HTTP
+        client and the cache database
+        
+        The in-memory caches keep working afterwards, just without persistence.
+        """
+        if self._http is not None:
+            http_client = self._http
+            self._http = None
+            await http_client.aclose()
+        
+        async with self._session_lock:
+            exit_stack = self._exit_stack
+            self._exit_stack = None
+            self._session_ctx = None
+            self._session = None
+            if exit_stack is not None:
+                await exit_stack.aclose()
+        
+        if self._cache_store is not None:
+            cache_store = self._cache_store
+            self._cache_store = None
+            self.response_cache.store = None
+            cache_store.close()
+    
+    def _tools_cache_key(self) -> Tuple:
+        return (self.mcp_server_params.command, tuple(self.mcp_server_params.args))
+    
+    def _load_cached_tools(self) -> Optional[List[ToolSpec]]:
+        """Return a fresh cached tool list from memory or the persistent cache, if any"""
+        key = self._tools_cache_key()
+        
+        cached = _TOOLS_CACHE.get(key)
+        if cached is not None:
+            ts, tools = cached
+            if time.monotonic() - ts < self.cache_ttl_seconds:
+                return tools
+        
+        try:
+            if self._cache_store is not None:
+                entry = self._cache_store.load_tools(_dump_json(key).decode())
+            else:
+                entry = _load_json(_TOOLS_CACHE_FILE.read_bytes()).get(_dump_json(key).decode())
+        except (OSError, ValueError):
+            return None
+        
+        if entry is None:
+            return None
+        
+        try:
+            age = time.time() - entry["created"]
+            tools = [ToolSpec(**tool) for tool in entry["tools"]]
+        except (KeyError, TypeError):
+            return None
+        
+        if not 0 <= age < self.cache_ttl_seconds:
+            return None
+        
+        # Back-date the in-memory entry so it expires with the disk copy
+        _TOOLS_CACHE[key] = (time.monotonic() - age, tools)
+        return tools
+    
+    def _store_cached_tools(self, tools: List[ToolSpec]):
+        """Save the tool list to the in-memory and persistent caches"""
+        key = self._tools_cache_key()
+        _TOOLS_CACHE[key] = (time.monotonic(), tools)
+        
+        key_name = _dump_json(key).decode()
+        tool_dicts = [asdict(tool) for tool in tools]
+        
+        if self._cache_store is not None:
+            self._cache_store.save_tools(key_name, tool_dicts, time.time())
+            return
+        
+        try:
+            try:
+                data = _load_json(_TOOLS_CACHE_FILE.read_bytes())
+            except (OSError, ValueError):
+                data = {}
+            data[key_name] = {"created": time.time(), "tools": tool_dicts}
+            _TOOLS_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            _TOOLS_CACHE_FILE.write_bytes(_dump_json(data))
+        except (OSError, TypeError) as e:
+            logger.warning("⚠️  Warning: Could not persist tool cache: %s", e)
+    
+    async def _discover_tools(self, session: ClientSession):
+        """Discover and cache available MCP tools"""
+        cached_tools = self._load_cached_tools() if self.cache else None
+        
+        if cached_tools is not None:
+            self.available_tools = cached_tools
+            logger.info("🔧 Loaded %d MCP tools from cache", len(self.available_tools))
+        else:
+            try:
+                tools_result = await session.list_tools()
+                self.available_tools = [
+                    ToolSpec(
+                        name=tool.name,
+                        description=tool.description,
+                        input_schema=tool.inputSchema if hasattr(tool, 'inputSchema') else {}
+                    )
+                    for tool in tools_result.tools
+                ]
                 
-        except Exception as e:
-            print(f"⚠️  Warning: Could not discover tools: {e}")
-            self.available_tools = []
+                logger.info("🔧 Discovered %d MCP tools", len(self.available_tools))
+                for tool in self.available_tools:
+                    logger.debug("   - %s: %s", tool.name, tool.description)
+                    
+            except Exception as e:
+                logger.warning("⚠️  Warning: Could not discover tools: %s", e)
+                self.available_tools = []
+            else:
+                if self.cache:
+                    self._store_cached_tools(self.available_tools)
+        
+        # The tool list only changes here, so build the system prompt once
+        self._system_prompt = self._create_system_prompt()
+        self._system_message = self._create_system_message()
+    
+    def _get_http_client(self) -> Optional[httpx.AsyncClient]:
+        """Return the ClickHouse HTTP client, or None if the fast path is unavailable"""
+        if not self.clickhouse_http_url or pa is None:
+            return None
+        
+        if self._http is None:
+            user = os.getenv("CLICKHOUSE_USER")
+            self._http = httpx.AsyncClient(
+                base_url=self.clickhouse_http_url,
+                auth=(user, os.getenv("CLICKHOUSE_PASSWORD", "")) if user else None,
+                timeout=float(os.getenv("CLICKHOUSE_SEND_RECEIVE_TIMEOUT", "300"))
+            )
+        return self._http
+    
+    async def _run_select_query_http(self, query: str) -> Optional[str]:
+        """
+        Run a SELECT directly over ClickHouse HTTP, decoding the result as Arrow
+        
+        The query is sent as a GET request, which ClickHouse always executes
+        with readonly=1.
+        
+        Returns a CSV preview of the result for the LLM, or None when the
+        fast path is unavailable and the MCP tool should be used instead.
+        """
+        http_client = self._get_http_client()
+        # A query with its own FORMAT clause cannot be read back as Arrow
+        if http_client is None or _TRAILING_FORMAT_RE.search(query):
+            return None
+        
+        params = {}
+        if os.getenv("CLICKHOUSE_DATABASE"):
+            params["database"] = os.getenv("CLICKHOUSE_DATABASE")
+        
+        # GET keeps ClickHouse in readonly mode, matching the MCP tool's restrictions
+        params["query"] = f"{query}\nFORMAT ArrowStream"
+        try:
+            response = await http_client.get("/", params=params)
+        except httpx.TransportError as e:
+            logger.warning("⚠️  ClickHouse HTTP unavailable, falling back to MCP: %s", e)
+            return None
+        
+        if response.is_error:
+            raise MCPToolError(f"Query failed: {response.text.strip()}")
+        
+        if not response.content:
+            return "Query returned no rows"
+        
+        table = pa.ipc.open_stream(response.content).read_all()
+        
+        preview = pa.BufferOutputStream()
+        pa.csv.write_csv(table.slice(0, _RESULT_PREVIEW_ROWS), preview)
+        result = preview.getvalue().to_pybytes().decode()
+        
+        if table.num_rows > _RESULT_PREVIEW_ROWS:
+            result += f"... ({table.num_rows} rows total, first {_RESULT_PREVIEW_ROWS} shown)"
+        return result
+    
+    @staticmethod
+    def _guard_select_query(query: str) -> str:
+        """
+        Enforce the SELECT-only, bounded-rows rules on an LLM-generated query
+        
+        After leading and trailing comments are stripped, only SELECT/WITH
+        queries and metadata statements (SHOW, DESCRIBE, EXPLAIN, EXISTS)
+        are accepted; anything else raises MCPToolError. SELECT/WITH queries
+        get LIMIT 100 inserted before any trailing SETTINGS/FORMAT clause
+        when their outermost LIMIT is missing, or have that LIMIT's row
+        count lowered to the cap.
+        
+        Clauses are located on a copy with quoted strings and identifiers
+        blanked out, so keywords inside them are never matched.
+        """
+        sql = query
+        while (comment := _LEADING_COMMENT_RE.match(sql)) is not None:
+            sql = sql[comment.end():]
+        
+        masked = _QUOTED_RE.sub(_mask_quoted, sql)
+        trailing_comment = _TRAILING_COMMENT_RE.search(masked)
+        if trailing_comment is not None:
+            sql = sql[:trailing_comment.start()]
+            masked = masked[:trailing_comment.start()]
+        
+        # Quotes are kept in the mask, so both strip to the same span
+        sql = sql.strip().rstrip(";").rstrip()
+        masked = masked.strip().rstrip(";").rstrip()
+        
+        if _METADATA_RE.match(sql):
+            return sql
+        
+        if not _READ_RE.match(sql):
+            raise MCPToolError("Only read-only SELECT queries are allowed")
+        
+        # LIMIT goes before the trailing SETTINGS/FORMAT clauses
+        tail_start = _SQL_TAIL_RE.search(masked).start()
+        body, tail = sql[:tail_start], sql[tail_start:]
+        
+        limit = _TRAILING_LIMIT_RE.search(masked[:tail_start])
+        if limit is None:
+            body = f"{body}\nLIMIT {_MAX_QUERY_ROWS}"
+        elif int(limit.group(1)) > _MAX_QUERY_ROWS:
+            body = f"{body[:limit.start(1)]}{_MAX_QUERY_ROWS}{body[limit.end(1):]}"
+        
+        return body + tail
+    
+    def _extract_content(self, result: Any) -> Any:
+        """
+        Extract the payload from an MCP tool result
+        
+        How to read a content item is resolved once per content type and
+        cached, so repeated results skip the attribute probing.
+        """
+        content = getattr(result, 'content', None)
+        if not content:
+            return "Tool executed successfully but returned no content"
+        if not isinstance(content, list):
+            return str(content)
+        
+        content_item = content[0]
+        extractor = self._content_extractors.get(type(content_item))
+        
+        if extractor is None:
+            if hasattr(content_item, 'text'):
+                extractor = operator.attrgetter('text')
+            elif hasattr(content_item, 'data'):
+                extractor = operator.attrgetter('data')
+            else:
+                extractor = str
+            self._content_extractors[type(content_item)] = extractor
+        
+        return extractor(content_item)
     
     async def execute_mcp_tool(self, session: ClientSession, tool_name: str, arguments: Dict[str, Any]) -> Any:
         """
         Execute an MCP tool and return the result
+        
+        run_select_query arguments are passed through _guard_select_query
+        first. The query then goes over ClickHouse HTTP when
+        CLICKHOUSE_HTTP_URL is set and pyarrow is installed; everything else
+        uses MCP.
         """
         try:
-            print(f"🔨 Executing MCP tool: {tool_name} with args: {arguments}")
+            if tool_name == "run_select_query" and "query" in arguments:
+                arguments = {**arguments, "query": self._guard_select_query(arguments["query"])}
+            
+            logger.debug("🔨 Executing MCP tool %s args=%s", tool_name, arguments)
+            
+            if tool_name == "run_select_query" and "query" in arguments:
+                result = await self._run_select_query_http(arguments["query"])
+                if result is not None:
+                    return result
             
             result = await session.call_tool(tool_name, arguments)
             
             if result.isError:
                 raise MCPToolError(f"Tool execution failed: {result.content}")
             
-            # Extract content from result
-            if hasattr(result, 'content') and result.content:
-                if isinstance(result.content, list) and len(result.content) > 0:
-                    # Handle list of content items
-                    content_item = result.content[0]
-                    if hasattr(content_item, 'text'):
-                        return content_item.text
-                    elif hasattr(content_item, 'data'):
-                        return content_item.data
-                    else:
-                        return str(content_item)
-                else:
-                    return str(result.content)
-            else:
-                return "Tool executed successfully but returned no content"
+            return self._extract_content(result)
                 
         except Exception as e:
             error_msg = f"MCP tool execution failed: {str(e)}"
-            print(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             raise MCPToolError(error_msg)
     
-    def _create_system_prompt(self) -> str:
-        """Create the system prompt for the LLM"""
+    def _static_system_prefix(self) -> str:
+        """
+        Create the stable part of the system prompt (schema + tools)
+        
+        This text must stay byte-identical between calls so provider-side
+        prompt-prefix caching can reuse it.
+        """
         tools_description = "\n".join([
-            f"- {tool['name']}: {tool['description']}"
+            f"- {tool.name}: {tool.description}"
             for tool in self.available_tools
         ])
         
@@ -197,7 +910,7 @@ AVAILABLE MCP TOOLS:
 2. Use the appropriate MCP tools to query the database
 3. For SQL queries, generate ClickHouse-compatible SQL with proper LIMIT clauses
 4. Always explain your findings in clear, user-friendly language
-5. If you need to make multiple queries, do them step by step
+5. If you need to make multiple queries, do dependent ones step by step and independent ones together
 
 TOOL USAGE FORMAT:
 When you need to use a tool, respond with:
@@ -206,114 +919,351 @@ TOOL_CALL: {{
     "arguments": {{"arg1": "value1", "arg2": "value2"}}
 }}
 
+When you need several tools whose results do not depend on each other, request them together:
+TOOL_CALLS: [
+    {{"tool_name": "first_tool", "arguments": {{}}}},
+    {{"tool_name": "second_tool", "arguments": {{"arg1": "value1"}}}}
+]
+
 IMPORTANT TOOL SIGNATURES:
 - list_databases(): No parameters needed
 - list_tables(database): Requires database name (e.g., "goteth_mainnet")
 - run_select_query(query): Only requires SQL query string, database connection is already established
-
-After receiving tool results, provide a comprehensive answer based on the data.
 """
     
-    async def get_llm_response(self, user_message: str, conversation_history: List[Dict[str, str]]) -> str:
+    def _create_system_prompt(self) -> str:
+        """Create the system prompt for the LLM"""
+        return self._static_system_prefix() + _SYSTEM_PROMPT_TAIL
+    
+    def _create_system_message(self) -> Dict[str, Any]:
+        """
+        Create the system message, marking the static prefix as cacheable
+        for providers that support explicit cache_control blocks
+        
+        Built from self._system_prompt, which must already be set.
+        """
+        if not self.use_cache_control:
+            return {"role": "system", "content": self._system_prompt}
+        
+        static_prefix = self._system_prompt[:-len(_SYSTEM_PROMPT_TAIL)]
+        return {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text",
+                    "text": static_prefix,
+                    "cache_control": {"type": "ephemeral"}
+                },
+                {"type": "text", "text": _SYSTEM_PROMPT_TAIL}
+            ]
+        }
+    
+    async def get_llm_response(self, user_message: str,
+                               on_token: Optional[Callable[[str], None]] = None) -> str:
         """
         Get response from Groq LLM
+        
+        user_message and the reply are appended to the conversation history;
+        the request carries the system message plus as much history as fits
+        in the token budget.
+        
+        The completion is streamed; on_token (if given) receives the reply
+        text as it arrives, up to (not including) the first tool call, plus the
+        error message if the request fails. Streaming stops as soon as a
+        complete TOOL_CALLS batch or TOOL_CALL object has been received,
+        unless another TOOL_CALL tag follows the object directly.
         """
-        messages = [
-            {"role": "system", "content": self._create_system_prompt()}
-        ]
+        if self._system_message is None:
+            self._system_prompt = self._create_system_prompt()
+            self._system_message = self._create_system_message()
         
-        # Add conversation history
-        messages.extend(conversation_history)
+        self._history.append({"role": "user", "content": user_message})
         
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
+        # Static system prefix first, so only the history and user turn vary
+        messages = [self._system_message, *self._prune_history(self._history)]
+        
+        # Only near-deterministic sampling is worth caching
+        use_cache = self.cache and self.temperature <= _MAX_CACHEABLE_TEMPERATURE
+        if use_cache:
+            cache_key = hashlib.sha256(_dump_json(
+                [self.model_name, self.temperature, messages], sort_keys=True
+            )).hexdigest()
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                if on_token is not None:
+                    call_index = self._tool_call_start(cached_response, cached_response.find(_TOOL_TAG))
+                    self._echo_reply(cached_response, 0, call_index, on_token, final=True)
+                self._history.append({"role": "assistant", "content": cached_response})
+                return cached_response
         
         try:
-            response = await self.groq_client.chat.completions.create(
+            stream = await self.groq_client.chat.completions.create(
                 model=self.model_name,
                 messages=messages,
-                temperature=0.1,  # Low temperature for precise analysis
-                max_tokens=1000
+                temperature=self.temperature,
+                max_tokens=1000,
+                stream=True
             )
             
-            return response.choices[0].message.content
+            content = ""
+            tag_index = -1
+            first_call_index = call_end = -1
+            echoed = 0
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                
+                # Only rescan the tail that could contain a newly completed tag
+                scan_from = max(len(content) - _TOOL_TAG_SPAN, 0)
+                content += delta
+                
+                if call_end >= 0:
+                    # After a complete call, only another tag may follow
+                    following = content[call_end:].lstrip()
+                    if following.startswith(_TOOL_TAG):
+                        tag_index = len(content) - len(following)
+                        call_end = -1
+                    elif not _TOOL_TAG.startswith(following):
+                        content = content[:call_end]
+                        await stream.close()
+                        break
+                elif tag_index < 0:
+                    tag_index = content.find(_TOOL_TAG, scan_from)
+                if on_token is not None and first_call_index < 0:
+                    echoed = self._echo_reply(content, echoed, tag_index, on_token)
+                if tag_index < 0 or ("}" not in delta and "]" not in delta):
+                    continue
+                
+                try:
+                    payload, json_end = self._decode_tool_payload(content, tag_index)
+                except ValueError:
+                    continue
+                
+                if first_call_index < 0:
+                    first_call_index = tag_index
+                    if on_token is not None:
+                        echoed = self._echo_reply(content, echoed, tag_index, on_token, final=True)
+                
+                # Dispatch a complete TOOL_CALLS batch right away
+                if isinstance(payload, list):
+                    content = content[:json_end]
+                    await stream.close()
+                    break
+                
+                # A single call is dispatched unless another tag follows it
+                tag_index = -1
+                call_end = json_end
+                following = content[call_end:].lstrip()
+                if following and not _TOOL_TAG.startswith(following[:len(_TOOL_TAG)]):
+                    content = content[:call_end]
+                    await stream.close()
+                    break
+            
+            if on_token is not None and first_call_index < 0:
+                # Flush the held-back text, unless the stream ended on a call
+                call_index = self._tool_call_start(content, tag_index)
+                self._echo_reply(content, echoed, call_index, on_token, final=True)
             
         except Exception as e:
-            return f"Error getting LLM response: {str(e)}"
+            self._history.pop()
+            error_message = f"Error getting LLM response: {str(e)}"
+            if on_token is not None:
+                on_token(error_message)
+            return error_message
+        
+        if use_cache and content:
+            self.response_cache.set(cache_key, content, self.response_cache_ttl_seconds)
+        
+        self._history.append({"role": "assistant", "content": content or ""})
+        return content
     
-    def _extract_tool_call(self, llm_response: str) -> Optional[Dict[str, Any]]:
+    @staticmethod
+    def _echo_reply(content: str, echoed: int, stop: int,
+                    on_token: Callable[[str], None], final: bool = False) -> int:
         """
-        Extract tool call from LLM response if present
+        Pass content[echoed:stop] to on_token and return the new echoed offset
+        
+        While streaming, stop is the start of a tag whose payload is still
+        incomplete (or -1), and without one the last few characters are held
+        back in case the next delta completes a tag there. With final set,
+        stop is the start of the first tool call (or -1 for none); everything
+        before it is flushed and -1 is returned, so nothing more is echoed.
         """
-        if "TOOL_CALL:" not in llm_response:
-            return None
+        if echoed < 0:
+            return echoed
+        if stop < 0:
+            stop = len(content) if final else max(len(content) - len(_TOOL_TAG) + 1, echoed)
         
+        if stop > echoed:
+            on_token(content[echoed:stop])
+        if not final:
+            return stop
+        
+        # Keep the answer that follows the tool call on its own line
+        if stop < len(content) and content[:stop].strip() and not content[:stop].endswith("\n"):
+            on_token("\n")
+        return -1
+    
+    def _tool_call_start(self, text: str, tag_index: int) -> int:
+        """Return tag_index if a complete tool call payload follows it, else -1"""
+        if tag_index < 0:
+            return -1
         try:
-            # Find the JSON part after TOOL_CALL:
-            tool_call_start = llm_response.find("TOOL_CALL:") + len("TOOL_CALL:")
-            tool_call_json = llm_response[tool_call_start:].strip()
+            self._decode_tool_payload(text, tag_index)
+        except ValueError:
+            return -1
+        return tag_index
+    
+    def _decode_tool_payload(self, text: str, tag_index: int) -> Tuple[Any, int]:
+        """
+        Decode the JSON following a TOOL_CALL:/TOOL_CALLS: tag at tag_index
+        
+        Returns the decoded object (dict or list) and the index just past it.
+        Raises ValueError if the payload is missing or incomplete.
+        """
+        payload_index = tag_index + len(_TOOL_TAG)
+        if text.startswith("S:", payload_index):
+            opener = "["
+        elif text.startswith(":", payload_index):
+            opener = "{"
+        else:
+            raise ValueError("No tool call payload after tag")
+        
+        json_start = text.find(opener, payload_index)
+        if json_start < 0:
+            raise ValueError("No tool call payload after tag")
+        
+        # raw_decode stops at the end of the first complete value
+        return _JSON_DECODER.raw_decode(text, json_start)
+    
+    def _extract_tool_calls(self, llm_response: str) -> List[Dict[str, Any]]:
+        """
+        Extract all tool calls (TOOL_CALL: {...} or TOOL_CALLS: [...]) from LLM response
+        """
+        tool_calls = []
+        tag_index = llm_response.find(_TOOL_TAG)
+        
+        while tag_index >= 0:
+            try:
+                payload, end_index = self._decode_tool_payload(llm_response, tag_index)
+            except ValueError as e:
+                logger.warning("⚠️  Could not parse tool call: %s", e)
+                break
             
-            # Extract JSON object
-            if tool_call_json.startswith("{"):
-                # Find the matching closing brace
-                brace_count = 0
-                end_index = 0
-                for i, char in enumerate(tool_call_json):
-                    if char == "{":
-                        brace_count += 1
-                    elif char == "}":
-                        brace_count -= 1
-                        if brace_count == 0:
-                            end_index = i + 1
-                            break
-                
-                tool_call_json = tool_call_json[:end_index]
-                return json.loads(tool_call_json)
-                
-        except (json.JSONDecodeError, IndexError) as e:
-            print(f"⚠️  Could not parse tool call: {e}")
+            for tool_call in payload if isinstance(payload, list) else [payload]:
+                if isinstance(tool_call, dict) and "tool_name" in tool_call:
+                    tool_calls.append(tool_call)
             
-        return None
+            tag_index = llm_response.find(_TOOL_TAG, end_index)
+        
+        return tool_calls
+    
+    def _prune_history(self, conversation_history: Reversible[Dict[str, str]],
+                       budget: int = _HISTORY_TOKEN_BUDGET) -> List[Dict[str, str]]:
+        """
+        Return the most recent messages that fit within an approximate token budget
+        
+        Tokens are estimated as characters / 4, which is close enough for
+        bounding request size without a model-specific tokenizer. The newest
+        message is always kept.
+        """
+        kept = []
+        used = 0
+        
+        for message in reversed(conversation_history):
+            used += len(message["content"]) // 4
+            if used > budget and kept:
+                break
+            kept.append(message)
+        
+        kept.reverse()
+        return kept
     
-    async def process_conversation_turn(self, session: ClientSession, user_message: str, 
-                                      conversation_history: List[Dict[str, str]]) -> str:
+    def _truncate_tool_result(self, result: Any) -> str:
+        """Cut an oversized tool result down to its head and tail"""
+        text = str(result)
+        if len(text) <= _MAX_TOOL_RESULT_CHARS:
+            return text
+        
+        half = _MAX_TOOL_RESULT_CHARS // 2
+        return f"{text[:half]}\n...truncated {len(text) - 2 * half} characters...\n{text[-half:]}"
+    
+    async def process_conversation_turn(self, session: ClientSession, user_message: str,
+                                      on_token: Optional[Callable[[str], None]] = None) -> str:
         """
         Process a single conversation turn, potentially involving tool calls
+        
+        on_token is passed through to get_llm_response for every LLM call
+        and also receives any message returned without an LLM call, so a
+        caller streaming through it has seen the whole returned response.
+        Large tool results are truncated before they are sent back to the
+        LLM.
         """
         max_iterations = 3  # Prevent infinite loops
         current_message = user_message
         
         for iteration in range(max_iterations):
             # Get LLM response
-            llm_response = await self.get_llm_response(current_message, conversation_history)
+            llm_response = await self.get_llm_response(current_message, on_token=on_token)
             
-            # Check if LLM wants to use a tool
-            tool_call = self._extract_tool_call(llm_response)
+            # Check if LLM wants to use any tools
+            tool_calls = self._extract_tool_calls(llm_response)
             
-            if tool_call is None:
+            if not tool_calls:
                 # No tool call, return the response
                 return llm_response
             
-            # Execute the tool
-            try:
-                tool_result = await self.execute_mcp_tool(
-                    session,
-                    tool_call["tool_name"],
-                    tool_call["arguments"]
-                )
-                
-                # Add tool result to conversation and continue
-                conversation_history.extend([
-                    {"role": "assistant", "content": llm_response},
-                    {"role": "user", "content": f"Tool result: {tool_result}"}
-                ])
-                
-                current_message = "Please provide a comprehensive answer based on the tool results above."
-                
-            except MCPToolError as e:
-                return f"I encountered an error while querying the database: {e}"
+            # Coalesce repeated calls so each distinct query runs only once
+            tool_calls = list({
+                _dump_json([tool_call["tool_name"], tool_call.get("arguments", {})], sort_keys=True): tool_call
+                for tool_call in tool_calls
+            }.values())
+            
+            # Execute independent tool calls concurrently
+            results = await asyncio.gather(
+                *(
+                    self.execute_mcp_tool(
+                        session,
+                        tool_call["tool_name"],
+                        tool_call.get("arguments", {})
+                    )
+                    for tool_call in tool_calls
+                ),
+                return_exceptions=True
+            )
+            
+            for result in results:
+                if isinstance(result, MCPToolError):
+                    error_message = f"I encountered an error while querying the database: {result}"
+                    if on_token is not None:
+                        on_token(error_message)
+                    return error_message
+                if isinstance(result, BaseException):
+                    raise result
+            
+            if len(results) == 1:
+                labels = ["Tool result"]
+            else:
+                labels = [f"Tool result ({tool_call['tool_name']})" for tool_call in tool_calls]
+            
+            tool_results_message = "\n\n".join(
+                f"{label}: {self._truncate_tool_result(result)}"
+                for label, result in zip(labels, results)
+            )
+            
+            # Send the tool results back as the next user message and continue
+            current_message = (
+                f"{tool_results_message}\n\n"
+                "Please provide a comprehensive answer based on the tool results above."
+            )
         
-        return "I'm having trouble completing this request after multiple attempts."
+        give_up_message = "I'm having trouble completing this request after multiple attempts."
+        if on_token is not None:
+            on_token(give_up_message)
+        return give_up_message
     
     async def chat_loop(self):
         """
@@ -325,83 +1275,68 @@ After receiving tool results, provide a comprehensive answer based on the data.
         print("   Type 'quit' to exit")
         print("="*80 + "\n")
         
-        # Use proper async context manager pattern
-        transport = await self.create_mcp_session()
+        session = await self._get_session()
         
-        async with transport as (read_stream, write_stream):
-            async with ClientSession(read_stream, write_stream) as session:
-                await self.initialize_session(session)
+        try:
+            while True:
+                # Read input off the event loop so it keeps running
+                user_input = (await _ainput("\n💬 You: ")).strip()
                 
-                conversation_history = []
+                if user_input.lower() in _EXIT_CMDS:
+                    print("👋 Goodbye!")
+                    break
                 
-                while True:
-                    user_input = input("\n💬 You: ").strip()
-                    
-                    if user_input.lower() in ['quit', 'exit', 'bye']:
-                        print("👋 Goodbye!")
-                        break
-                    
-                    if not user_input:
-                        continue
-                    
-                    print("\n🤔 Thinking...")
-                    
-                    # Process the conversation turn
-                    response = await self.process_conversation_turn(
-                        session, user_input, conversation_history
-                    )
-                    
-                    print(f"\n🤖 Assistant: {response}")
-                    
-                    # Add to conversation history
-                    conversation_history.extend([
-                        {"role": "user", "content": user_input},
-                        {"role": "assistant", "content": response}
-                    ])
-                    
-                    # Keep conversation history manageable
-                    if len(conversation_history) > 20:
-                        conversation_history = conversation_history[-20:]
+                if not user_input:
+                    continue
+                
+                print("\n🤔 Thinking...")
+                print("\n🤖 Assistant: ", end="", flush=True)
+                
+                # The answer is printed as it streams in, so nothing is
+                # printed once the turn returns
+                await self.process_conversation_turn(
+                    session, user_input, on_token=_echo_token
+                )
+                print()
+        finally:
+            await self.aclose()
 
 
 async def test_basic_functionality():
     """
     Test basic MCP connectivity and tool discovery
     """
-    print("🧪 Testing basic MCP functionality...")
+    logger.info("🧪 Testing basic MCP functionality...")
     
     chatbot = BlockchainChatbotMCPv3()
     
     try:
-        # Use proper async context manager pattern
-        transport = await chatbot.create_mcp_session()
+        session = await chatbot._get_session()
         
-        async with transport as (read_stream, write_stream):
-            async with ClientSession(read_stream, write_stream) as session:
-                await chatbot.initialize_session(session)
-                
-                # Test basic queries
-                test_queries = [
-                    ("list_databases", {}),
-                    ("list_tables", {"database": "goteth_mainnet"}),
-                ]
-                
-                for tool_name, args in test_queries:
-                    try:
-                        result = await chatbot.execute_mcp_tool(session, tool_name, args)
-                        print(f"✅ {tool_name}: Success")
-                        print(f"   Result preview: {str(result)[:200]}...")
-                    except Exception as e:
-                        print(f"❌ {tool_name}: {e}")
-                
-                print("✅ Basic functionality test completed")
+        # Test basic queries
+        test_queries = [
+            ("list_databases", {}),
+            ("list_tables", {"database": "goteth_mainnet"}),
+        ]
+        
+        for tool_name, args in test_queries:
+            try:
+                result = await chatbot.execute_mcp_tool(session, tool_name, args)
+                logger.info("✅ %s: Success", tool_name)
+                logger.debug("   Result preview: %.200s...", result)
+            except Exception as e:
+                logger.error("❌ %s: %s", tool_name, e)
+        
+        logger.info("✅ Basic functionality test completed")
         
     except Exception as e:
-        print(f"❌ Test failed: {e}")
+        logger.error("❌ Test failed: %s", e)
+    finally:
+        await chatbot.aclose()
 
 
 if __name__ == "__main__":
-    import sys
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
     
     if len(sys.argv) > 1 and sys.argv[1] == "test":
         # Run basic functionality test